@@ -74,11 +74,12 @@ def sparse_conditional_weight(X, base_pred, temp,
     base_names = list(base_pred.keys())
 
     # Note: skip the first model
-    W_raw = tf.stack([
-        gp.prior(X, kernel_func=kernel_func,
-                 ridge_factor=ridge_factor,
-                 name='base_weight_{}'.format(base_names), **kwargs)
-        for base_names in base_names], axis=1)
+    W_raw = tf.stack(
+        gp.prior_batched(X, kernel_func=kernel_func,
+                         ridge_factor=ridge_factor,
+                         names=['base_weight_{}'.format(base_name)
+                                for base_name in base_names],
+                         **kwargs), axis=1)
 
     # specify normalized GP weights by family group
     W_model = link_func(W_raw, tf.exp(temp), name=name)
@@ -428,9 +429,9 @@ def variational_family(X, base_pred,
 
         > GP variational parameters:
 
-        weight_gp_mean_dict: (dict of tf.Variable) Dictionary of variational parameters for
+        weight_gp_mean_dict: (dict of tf.Tensor) Dictionary of variational parameters for
             the mean of node weight GP.
-        weight_gp_vcov_dict: (dict of tf.Variable) Dictionary of variational parameters for
+        weight_gp_vcov_dict: (dict of tf.Tensor) Dictionary of variational parameters for
             the stddev or covariance matrix of node weight GP.
         resid_gp_mean_dict: (dict of tf.Variable) Dictionary of variational parameters for
             the mean of residual GP.
@@ -99,7 +99,7 @@ def rbf(X, X2=None, ls=1., ridge_factor=0.):
 
 
 def prior(X, ls, kernel_func=rbf,
-          ridge_factor=1e-3, name=None):
+          ridge_factor=1e-3, name=None, cache=None):
     """Defines Gaussian Process prior with kernel_func.
 
     Args:
@@ -110,20 +110,105 @@ def prior(X, ls, kernel_func=rbf,
         ls: (float32) length scale parameter.
         ridge_factor: (float32) ridge factor to stabilize Cholesky decomposition.
         name: (str) name of the random variable
+        cache: (dict or None) Cache of kernel matrix Cholesky decompositions
+            to be shared across calls, see kernel_cholesky.
 
     Returns:
         (ed.RandomVariable) A random variable representing the Gaussian Process,
             dimension (N,)
 
     """
-    X = tf.convert_to_tensor(X, dtype=tf.float32)
-    N, _ = X.shape.as_list()
+    return prior_batched(X, ls, names=[name],
+                         kernel_func=kernel_func,
+                         ridge_factor=ridge_factor,
+                         cache=cache)[0]
+
+
+def prior_batched(X, ls, names, kernel_func=rbf,
+                  ridge_factor=1e-3, cache=None):
+    """Defines independent Gaussian Process priors sharing the same kernel.
 
-    K_mat = kernel_func(X, ls=ls, ridge_factor=ridge_factor)
+    The kernel matrix and its Cholesky decomposition are computed once
+    and shared by all random variables.
+
+    Args:
+        X: (np.ndarray of float32) input training features.
+        with dimension (N, D).
+        ls: (float32) length scale parameter.
+        names: (list of str) names of the random variables.
+        kernel_func: (function) kernel function for the gaussian process.
+            Default to rbf.
+        ridge_factor: (float32) ridge factor to stabilize Cholesky decomposition.
+        cache: (dict or None) Cache of kernel matrix Cholesky decompositions
+            to be shared across calls, see kernel_cholesky.
 
-    return ed.MultivariateNormalTriL(loc=tf.zeros(N, dtype=tf.float32),
-                                     scale_tril=tf.cholesky(K_mat),
-                                     name=name)
+    Returns:
+        (list of ed.RandomVariable) Random variables representing the
+            Gaussian Processes, each with dimension (N,)
+    """
+    K_chol = kernel_cholesky(X, ls, kernel_func=kernel_func,
+                             ridge_factor=ridge_factor, cache=cache)
+    N = K_chol.shape.as_list()[0]
+
+    return [ed.MultivariateNormalTriL(loc=tf.zeros(N, dtype=tf.float32),
+                                      scale_tril=K_chol,
+                                      name=name)
+            for name in names]
+
+
+def kernel_cholesky(X, ls, kernel_func=rbf, ridge_factor=1e-3, cache=None):
+    """Computes Cholesky decomposition of the kernel matrix of X.
+
+    Args:
+        X: (np.ndarray of float32) input training features.
+        with dimension (N, D).
+        ls: (float32) length scale parameter.
+        kernel_func: (function) kernel function for the gaussian process.
+            Default to rbf.
+        ridge_factor: (float32) ridge factor to stabilize Cholesky decomposition.
+        cache: (dict or None) If not None, a dictionary to look up / store the
+            result in, keyed by X, kernel_func, ls and ridge_factor (see
+            _cache_key). It should only be shared within a single graph,
+            e.g. within one call to a model definition.
+
+    Returns:
+        (tf.Tensor of float32) Lower-triangular Cholesky factor of the kernel
+            matrix, dimension (N, N).
+    """
+    cache_key = (id(X), kernel_func, _cache_key(ls), _cache_key(ridge_factor))
+    if cache is not None and cache_key in cache:
+        _, K_chol = cache[cache_key]
+        return K_chol
+
+    X_tensor = tf.convert_to_tensor(X, dtype=tf.float32)
+
+    K_mat = kernel_func(X_tensor, ls=ls, ridge_factor=ridge_factor)
+    K_chol = tf.cholesky(K_mat)
+
+    if cache is not None:
+        # also hold on to the inputs, so their id cannot be reused while cached.
+        cache[cache_key] = ((X, ls, ridge_factor), K_chol)
+
+    return K_chol
+
+
+def _cache_key(value):
+    """Converts a kernel parameter into a hashable key for kernel_cholesky.
+
+    Python/numpy scalars (including 0-d arrays) are keyed by value,
+    other objects (e.g. tf.Tensor, np.ndarray) by identity.
+
+    Args:
+        value: (float, np.ndarray or tf.Tensor) kernel parameter.
+
+    Returns:
+        (float or int) hashable key.
+    """
+    if isinstance(value, (int, float, np.number)):
+        return float(value)
+    if isinstance(value, np.ndarray) and value.ndim == 0:
+        return float(value)
+    return id(value)
 
 
 """"""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
@@ -270,6 +355,81 @@ def variational_mfvi(X, mfvi_mixture=False, n_mixture=1, name="", **kwargs):
     return q_f, qf_mean, qf_sdev, mixture_par_list
 
 
+def _per_gp_initializer(size):
+    """Initializer reproducing the default (Glorot uniform) scale of a 1-D variable.
+
+    For a variable of shape [size], Glorot uniform samples from
+    U(-sqrt(3 / size), sqrt(3 / size)). Batched variables of shape
+    [n_gp, size] use this so that each row keeps the per-GP scale.
+
+    Args:
+        size: (int) length of the per-GP variational parameter.
+
+    Returns:
+        (tf.Initializer) uniform initializer.
+    """
+    limit = np.sqrt(3. / size)
+    return tf.random_uniform_initializer(-limit, limit)
+
+
+def variational_mfvi_batched(X, names, mfvi_mixture=False, n_mixture=1,
+                             name="", **kwargs):
+    """Defines the mean-field variational family for a group of Gaussian Processes.
+
+    Variational parameters of all GPs are allocated as one variable each for
+    mean and stddev, with shape (len(names), N), and initialized at the same
+    scale as in variational_mfvi.
+
+    Notice the variables are named '{name}_mean' and '{name}_sdev' rather than
+    per GP (i.e. '{names[k]}_mean'), so checkpoints saved with per-GP calls to
+    variational_mfvi are not compatible.
+
+    Args:
+        X: (np.ndarray of float32) input training features, with dimension (N, D).
+        names: (list of str) names of the variational random variables.
+        mfvi_mixture: (float32) Whether to output variational family with a
+            mixture of MFVI.
+        n_mixture: (int) Number of MFVI mixture component to add.
+        name: (str) name for the batched variational parameters.
+        kwargs: Dict of other keyword variables.
+            For compatibility purpose with other variational family.
+
+    Returns:
+        (list of tuple) For each name in names, a tuple of
+            (q_f, q_f_mean, q_f_sdev, mixture_par_list). See variational_mfvi.
+    """
+    X = tf.convert_to_tensor(X, dtype=tf.float32)
+
+    N, D = X.shape.as_list()
+
+    # define variational parameters
+    qf_mean_batch = tf.get_variable(shape=[len(names), N],
+                                    initializer=_per_gp_initializer(N),
+                                    name='{}_mean'.format(name))
+    qf_sdev_batch = tf.exp(tf.get_variable(shape=[len(names), N],
+                                           initializer=_per_gp_initializer(N),
+                                           name='{}_sdev'.format(name)))
+
+    # define variational family
+    variational_list = []
+    for gp_name, qf_mean, qf_sdev in zip(names,
+                                         tf.unstack(qf_mean_batch),
+                                         tf.unstack(qf_sdev_batch)):
+        mixture_par_list = []
+        if mfvi_mixture:
+            gp_dist = tfd.MultivariateNormalDiag(loc=qf_mean, scale_diag=qf_sdev,
+                                                 name=gp_name)
+            q_f, mixture_par_list = inference_util.make_mfvi_sgp_mixture_family(
+                n_mixture=n_mixture, N=N, gp_dist=gp_dist, name=gp_name)
+        else:
+            q_f = ed.MultivariateNormalDiag(loc=qf_mean, scale_diag=qf_sdev,
+                                            name=gp_name)
+
+        variational_list.append((q_f, qf_mean, qf_sdev, mixture_par_list))
+
+    return variational_list
+
+
 def variational_mfvi_sample(n_sample, qf_mean, qf_sdev,
                             mfvi_mixture=False, mixture_par_list=None,
                             **kwargs):
@@ -346,7 +506,7 @@ Consequently, U can be marginalized out, such that q(F) becomes
 
 def variational_sgpr(X, Z, ls=1., kernel_func=rbf, ridge_factor=1e-3,
                      mfvi_mixture=False, n_mixture=1,
-                     name="", **kwargs):
+                     name="", compute_dtype=tf.float32, **kwargs):
     """Defines the mean-field variational family for GPR.
 
     Args:
@@ -359,6 +519,8 @@ def variational_sgpr(X, Z, ls=1., kernel_func=rbf, ridge_factor=1e-3,
             mixture of MFVI.
         n_mixture: (int) Number of MFVI mixture component to add.
         name: (str) name for the variational parameter/random variables.
+        compute_dtype: (tf.DType) dtype for the projection matrix products, see
+            inference_util.make_sparse_gp_parameters.
         kwargs: Dict of other keyword variables.
             For compatibility purpose with other variational family.
 
@@ -372,18 +534,8 @@ def variational_sgpr(X, Z, ls=1., kernel_func=rbf, ridge_factor=1e-3,
     Nx, Nz = X.shape.as_list()[0], Z.shape.as_list()[0]
 
     # 1. Prepare constants
-    # compute matrix constants
-    Kxx = kernel_func(X, ls=ls)
-    Kxz = kernel_func(X, Z, ls=ls)
-    Kzz = kernel_func(Z, ls=ls, ridge_factor=ridge_factor)
-
-    # compute null covariance matrix using Cholesky decomposition
-    Kzz_chol_inv = tf.matrix_inverse(tf.cholesky(Kzz))
-    Kzz_inv = tf.matmul(Kzz_chol_inv, Kzz_chol_inv, transpose_a=True)
-
-    Kxz_Kzz_chol_inv = tf.matmul(Kxz, Kzz_chol_inv, transpose_b=True)
-    Kxz_Kzz_inv = tf.matmul(Kxz, Kzz_inv)
-    Sigma_pre = Kxx - tf.matmul(Kxz_Kzz_chol_inv, Kxz_Kzz_chol_inv, transpose_b=True)
+    Kxz_Kzz_inv, Sigma_pre = inference_util.make_sparse_gp_projection(
+        X, Z, ls=ls, kern_func=kernel_func, ridge_factor=ridge_factor)
 
     # 2. Define variational parameters
     # define free parameters (i.e. mean and full covariance of f_latent)
@@ -394,11 +546,9 @@ def variational_sgpr(X, Z, ls=1., kernel_func=rbf, ridge_factor=1e-3,
 
     # compute sparse gp variational parameter
     # (i.e. mean and covariance of P(f_obs | f_latent))
-    qf_mean = tf.tensordot(Kxz_Kzz_inv, m, [[1], [0]], name='{}_mean'.format(name))
-    qf_cov = (Sigma_pre +
-              tf.matmul(Kxz_Kzz_inv,
-                        tf.matmul(S, Kxz_Kzz_inv, transpose_b=True)) +
-              ridge_factor * tf.eye(Nx, dtype=tf.float32))
+    qf_mean, qf_cov = inference_util.project_sparse_gp_parameters(
+        m, S, Kxz_Kzz_inv, Sigma_pre, ridge_factor=ridge_factor,
+        mean_name='{}_mean'.format(name), compute_dtype=compute_dtype)
 
     # define variational family
     mixture_par_list = []
@@ -416,6 +566,88 @@ def variational_sgpr(X, Z, ls=1., kernel_func=rbf, ridge_factor=1e-3,
     return q_f, qf_mean, qf_cov, mixture_par_list
 
 
+def variational_sgpr_batched(X, Z, names, ls=1., kernel_func=rbf, ridge_factor=1e-3,
+                             mfvi_mixture=False, n_mixture=1,
+                             name="", compute_dtype=tf.float32, **kwargs):
+    """Defines the sparse GP variational family for a group of Gaussian Processes.
+
+    The kernel matrices are computed once and shared by all GPs. Variational
+    parameters of all GPs are allocated as one variable each for the latent
+    mean and covariance, with shape (len(names), Nz) and
+    (len(names), Nz * (Nz + 1) / 2), and initialized at the same scale as in
+    variational_sgpr.
+
+    Notice the variables are named '{name}_mean_latent' and
+    '{name}_cov_latent_s' rather than per GP (i.e. '{names[k]}_mean_latent'),
+    so checkpoints saved with per-GP calls to variational_sgpr are not
+    compatible.
+
+    Args:
+        X: (np.ndarray of float32) input training features, with dimension (Nx, D).
+        Z: (np.ndarray of float32) inducing points, with dimension (Nz, D).
+        names: (list of str) names of the variational random variables.
+        ls: (float32) length scale parameter.
+        kernel_func: (function) kernel function.
+        ridge_factor: (float32) small ridge factor to stabilize Cholesky decomposition
+        mfvi_mixture: (float32) Whether to output variational family with a
+            mixture of MFVI.
+        n_mixture: (int) Number of MFVI mixture component to add.
+        name: (str) name for the batched variational parameters.
+        compute_dtype: (tf.DType) dtype for the projection matrix products, see
+            inference_util.make_sparse_gp_parameters.
+        kwargs: Dict of other keyword variables.
+            For compatibility purpose with other variational family.
+
+    Returns:
+        (list of tuple) For each name in names, a tuple of
+            (q_f, q_f_mean, q_f_cov, mixture_par_list). See variational_sgpr.
+    """
+    X = tf.convert_to_tensor(X, dtype=tf.float32)
+    Z = tf.convert_to_tensor(Z, dtype=tf.float32)
+
+    Nx, Nz = X.shape.as_list()[0], Z.shape.as_list()[0]
+
+    # 1. Prepare constants
+    Kxz_Kzz_inv, Sigma_pre = inference_util.make_sparse_gp_projection(
+        X, Z, ls=ls, kern_func=kernel_func, ridge_factor=ridge_factor)
+
+    # 2. Define variational parameters
+    # define free parameters (i.e. mean and full covariance of f_latent)
+    Ns = Nz * (Nz + 1) // 2
+    m_batch = tf.get_variable(shape=[len(names), Nz],
+                              initializer=_per_gp_initializer(Nz),
+                              name='{}_mean_latent'.format(name))
+    s_batch = tf.get_variable(shape=[len(names), Ns],
+                              initializer=_per_gp_initializer(Ns),
+                              name='{}_cov_latent_s'.format(name))
+    L_batch = fill_triangular(s_batch, name='{}_cov_latent_chol'.format(name))
+    S_batch = tf.matmul(L_batch, L_batch, transpose_b=True,
+                        name='{}_cov_latent'.format(name))
+
+    # 3. Define variational family
+    variational_list = []
+    for gp_name, m, S in zip(names, tf.unstack(m_batch), tf.unstack(S_batch)):
+        qf_mean, qf_cov = inference_util.project_sparse_gp_parameters(
+            m, S, Kxz_Kzz_inv, Sigma_pre, ridge_factor=ridge_factor,
+            mean_name='{}_mean'.format(gp_name), compute_dtype=compute_dtype)
+
+        mixture_par_list = []
+        if mfvi_mixture:
+            gp_dist = tfd.MultivariateNormalFullCovariance(loc=qf_mean,
+                                                           covariance_matrix=qf_cov)
+            q_f, mixture_par_list = inference_util.make_mfvi_sgp_mixture_family(
+                n_mixture=n_mixture, N=Nx,
+                gp_dist=gp_dist, name=gp_name)
+        else:
+            q_f = ed.MultivariateNormalFullCovariance(loc=qf_mean,
+                                                      covariance_matrix=qf_cov,
+                                                      name=gp_name)
+
+        variational_list.append((q_f, qf_mean, qf_cov, mixture_par_list))
+
+    return variational_list
+
+
 def variational_sgpr_sample(n_sample, qf_mean, qf_cov,
                             mfvi_mixture=False, mixture_par_list=None, **kwargs):
     """Generates f samples from GPR mean-field variational family.
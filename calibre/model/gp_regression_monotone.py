@@ -366,7 +366,7 @@ def pred_cond_prior_v1(gp, gp_deriv,
     P_no, P_nd, Sigma_chol = inference_util.make_cond_gp_parameters(
         K_00=K_nn, K_11=K_oo, K_22=K_dd,
         K_01=K_no, K_20=K_dn, K_21=K_do,
-        ridge_factor=ridge_factor)
+        ridge_factor_K=ridge_factor)
 
     # compute conditional mean and variance.
     Mu = (tf.matmul(P_no, gp[:, tf.newaxis]) +
@@ -398,9 +398,9 @@ def compute_pred_cond_params(X_new, X_obs, X_deriv, ls,
         ridge_factor_Sigma: (float32) ridge factor to stabilize Cholesky decomposition.
 
     Returns:
-        P_01 (np.ndarray) Projection from f_obs to f_new
-        P_02 (np.ndarray) Projection from f_deriv to f_new
-        Sigma_chol (np.ndarray) Cholesky decomposition for Sigma
+        P_01 (tf.Tensor of float32) Projection from f_obs to f_new
+        P_02 (tf.Tensor of float32) Projection from f_deriv to f_new
+        Sigma (tf.Tensor of float32) Covariance matrix for f_new
     """
     X_new = tf.convert_to_tensor(X_new, dtype=tf.float32)
     X_obs = tf.convert_to_tensor(X_obs, dtype=tf.float32)
@@ -458,8 +458,10 @@ def pred_cond_prior(gp, gp_deriv,
         gp: (ed.RandomVariable) f_obs corresponding to X_obs in
             training dataset, shape (N_train, )
         gp_deriv: (ed.RandomVariable) f_deriv, (N_deriv, )
-        pred_cond_pars: (list of np.ndarray) list of parameters
-            (P_01, P_02, Sigma_chol) for pred_cond_prior. See
+        pred_cond_pars: (list of tf.Tensor) list of parameters
+            (P_01, P_02, Sigma_chol) for pred_cond_prior. The tensors returned by
+            compute_pred_cond_params are bound to the graph they are built in,
+            so evaluate them with a session first if used in another graph. See
             inference_util.make_cond_gp_parameters
         name: (str) name of the random variable.
 
@@ -534,8 +536,10 @@ def model_pred(X, X_deriv=None, X_pred=None, ls=1.,
             constraint on shape (N_deriv, D). If None, X_deriv=X
         X_pred: (tf.Tensor or None) Feature for prediction (N_pred, D).
         ls: (float32) length scale parameter.
-        pred_cond_pars: (list of np.ndarray) list of parameters
-            (P_01, P_02, Sigma_chol) for pred_cond_prior. See
+        pred_cond_pars: (list of tf.Tensor) list of parameters
+            (P_01, P_02, Sigma_chol) for pred_cond_prior. The tensors returned by
+            compute_pred_cond_params are bound to the graph they are built in,
+            so evaluate them with a session first if used in another graph. See
             inference_util.make_cond_gp_parameters
         ridge_factor: (float32) ridge factor to stabilize Cholesky decomposition.
 
@@ -679,8 +683,10 @@ def make_log_likelihood_function_with_pred(
         y_train: (tf.Tensor) Training labels, shape (N_obs, )
         ls: (tf.Tensor or None) Value of length scale parameter,
             if None then will be added to the likelihood function.
-        pred_cond_pars: (list of np.ndarray) list of parameters
-            (P_01, P_02, Sigma_chol) for pred_cond_prior. See
+        pred_cond_pars: (list of tf.Tensor) list of parameters
+            (P_01, P_02, Sigma_chol) for pred_cond_prior. The tensors returned by
+            compute_pred_cond_params are bound to the graph they are built in,
+            so evaluate them with a session first if used in another graph. See
             inference_util.make_cond_gp_parameters
         ridge_factor: (float32) ridge factor to stabilize Cholesky decomposition.
         deriv_prior_scale: (float32) Value for Prior scale parameter for
@@ -12,7 +12,10 @@
         _Presentation Slides_, 2011.
         https://www.eurandom.tue.nl/EURANDOM_chair/minicourseghoshal.pdf
 """
+import collections
 import functools
+import itertools
+import types
 
 import numpy as np
 
@@ -43,98 +46,146 @@ TEMP_NAME_PREFIX = "temp"
 """"""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
 
 
+def _tree_key(family_tree):
+    """Converts input family tree into a hashable key.
+
+    Node order is preserved, since it determines the order of the outputs.
+
+    Args:
+        family_tree: (dict of list) A dictionary of list of strings to
+            specify the family tree between models.
+
+    Returns:
+        (tuple of tuple) A tuple of (parent_name, tuple of child_names).
+    """
+    return tuple((parent_name, tuple(child_names))
+                 for parent_name, child_names in family_tree.items())
+
+
+@functools.lru_cache(maxsize=32)
+def _get_nonroot_node_names(tree_key):
+    """Cached implementation of get_nonroot_node_names."""
+    nonroot_node_names = np.asarray(list(itertools.chain.from_iterable(
+        child_names for _, child_names in tree_key)))
+    nonroot_node_names.flags.writeable = False
+
+    return nonroot_node_names
+
+
+@functools.lru_cache(maxsize=32)
+def _get_parent_node_names(tree_key):
+    """Cached implementation of get_parent_node_names."""
+    parent_node_names = np.asarray(
+        [parent_name for parent_name, _ in tree_key])
+    parent_node_names.flags.writeable = False
+
+    return parent_node_names
+
+
+@functools.lru_cache(maxsize=32)
+def _get_leaf_model_names(tree_key):
+    """Cached implementation of get_leaf_model_names."""
+    all_node_names = _get_nonroot_node_names(tree_key)
+    all_parent_names = _get_parent_node_names(tree_key)
+
+    # with assume_unique=True, order of all_node_names is preserved.
+    all_leaf_names = np.setdiff1d(all_node_names, all_parent_names,
+                                  assume_unique=True)
+
+    return tuple(all_leaf_names.tolist())
+
+
+@functools.lru_cache(maxsize=32)
+def _get_leaf_ancestry(tree_key):
+    """Cached implementation of get_leaf_ancestry."""
+    # get mapping from child to parent
+    parent_name_dict = dict()
+    for parent_name, child_names in tree_key:
+        for child_name in child_names:
+            parent_name_dict[child_name] = parent_name
+
+    # build ancestral path of each leaf, reusing the path of
+    # any ancestor that is already visited.
+    path_dict = {ROOT_NODE_DEFAULT_NAME: ()}
+    for leaf_model in _get_leaf_model_names(tree_key):
+        unvisited_names = [leaf_model]
+        while parent_name_dict[unvisited_names[-1]] not in path_dict:
+            unvisited_names.append(parent_name_dict[unvisited_names[-1]])
+
+        ancestry_path = path_dict[parent_name_dict[unvisited_names[-1]]]
+        for node_name in reversed(unvisited_names):
+            ancestry_path = (node_name,) + ancestry_path
+            path_dict[node_name] = ancestry_path
+
+    return types.MappingProxyType(
+        {leaf_model: path_dict[leaf_model]
+         for leaf_model in _get_leaf_model_names(tree_key)})
+
+
 def get_nonroot_node_names(family_tree):
     """Get names of non-root nodes of input family tree.
 
+    The result is cached for each family tree.
+
     Args:
         family_tree: (dict of list or None) A dictionary of list of strings to
             specify the family tree between models, if None then assume there's
             no structure (i.e. flat structure).
 
-    Raises:
-        (ValueError) If name of any leaf node did not appear in base_pred.
+    Returns:
+        (np.ndarray of str) Read-only array of non-root node names.
     """
-    return np.concatenate(list(family_tree.values()))
+    return _get_nonroot_node_names(_tree_key(family_tree))
 
 
 def get_parent_node_names(family_tree):
     """Get names of non-leaf nodes of input family tree.
 
+    The result is cached for each family tree.
+
     Args:
         family_tree: (dict of list or None) A dictionary of list of strings to
             specify the family tree between models, if None then assume there's
             no structure (i.e. flat structure).
 
-    Raises:
-        (ValueError) If name of any leaf node did not appear in base_pred.
+    Returns:
+        (np.ndarray of str) Read-only array of parent node names.
     """
-    return np.asarray(list(family_tree.keys()))
+    return _get_parent_node_names(_tree_key(family_tree))
 
 
 def get_leaf_model_names(family_tree):
     """Get names of leaf nodes of input family tree.
 
+    The result is cached for each family tree.
+
     Args:
         family_tree: (dict of list or None) A dictionary of list of strings to
             specify the family tree between models, if None then assume there's
             no structure (i.e. flat structure).
 
-    Raises:
-        (ValueError) If name of any leaf node did not appear in base_pred.
+    Returns:
+        (list of str) List of leaf node names.
     """
-    all_node_names = np.concatenate(list(family_tree.values()))
-    all_parent_names = get_parent_node_names(family_tree)
-
-    all_leaf_names = [name for name in all_node_names
-                      if name not in all_parent_names]
-
-    return all_leaf_names
+    return list(_get_leaf_model_names(_tree_key(family_tree)))
 
 
 def get_leaf_ancestry(family_tree):
     """Get ancestry of every leaf nodes of input family tree.
 
+    The result is cached for each family tree.
+
     Args:
         family_tree: (dict of list or None) A dictionary of list of strings to
             specify the family tree between models, if None then assume there's
             no structure (i.e. flat structure).
 
     Returns:
-        (dict of list of str) Dictionary of list of strings containing
-            ancestry name of each parent.
+        (Mapping of tuple of str) Read-only dictionary of tuple of strings
+            containing ancestry name of each leaf node, from the leaf node
+            up to (excluding) the root.
     """
-    # get mapping from child to parent
-    parent_name_dict = dict()
-    for parent_name, child_names in family_tree.items():
-        for child_name in child_names:
-            parent_name_dict.update({child_name: parent_name})
-
-    # get list of child names
-    leaf_model_names = get_leaf_model_names(family_tree)
-
-    # recusively build list of ancestor names for each child.
-    # TODO(jereliu): Ugly code. Improve with recursion.
-    leaf_ancestry_dict = dict()
-
-    for leaf_model in leaf_model_names:
-        ancestry_list = [leaf_model]
-        # append immediate parent
-        if parent_name_dict[leaf_model] == ROOT_NODE_DEFAULT_NAME:
-            leaf_ancestry_dict[leaf_model] = ancestry_list
-            continue
-        else:
-            ancestry_list.append(parent_name_dict[leaf_model])
-        # append rest of ancestors
-        while True:
-            child_name = ancestry_list[-1]
-            parent_name = parent_name_dict[child_name]
-            if parent_name == ROOT_NODE_DEFAULT_NAME:
-                break
-            ancestry_list.append(parent_name)
-
-        leaf_ancestry_dict[leaf_model] = ancestry_list
-
-    return leaf_ancestry_dict
+    return _get_leaf_ancestry(_tree_key(family_tree))
 
 
 def compute_cond_weights(X, family_tree,
@@ -162,6 +213,9 @@ def compute_cond_weights(X, family_tree,
     # TODO(jereliu): consistency check for name-value correspondence in tensors
     node_weight_dict = {}
 
+    # share kernel matrices across the GP priors of all nodes.
+    kwargs.setdefault("cache", {})
+
     # compute conditional weight for each child node in the tree
     # then aggregate into a dictionary
     for parent_name, child_names in family_tree.items():
@@ -203,21 +257,26 @@ def compute_leaf_weights(node_weights, family_tree, name=""):
         model_names_list (list of str) A list of string listing name of leaf-node
             models.
     """
-    model_ancestry_dict = get_leaf_ancestry(family_tree)
-
-    # for each child, multiply weights of its ancestry
-    # TODO(jereliu): Ugly code.
-    model_names_list = []
-    model_weight_list = []
-    for model_name, ancestor_names in model_ancestry_dict.items():
-        model_names_list.append(model_name)
-        ancestor_weight_list = [
-            node_weights[ancestor_name] for ancestor_name in ancestor_names]
-        model_weight_tensor = tf.reduce_prod(
-            tf.stack(ancestor_weight_list, axis=-1), axis=-1)
-        model_weight_list.append(model_weight_tensor)
-
-    model_weight_tensor = tf.stack(model_weight_list, axis=-1, name=name)
+    model_names_list = get_leaf_model_names(family_tree)
+
+    # traverse the tree top-down, such that the weight of each node is the
+    # product of its conditional weight and the weight of its parent.
+    # This way the product of shared ancestors is computed only once.
+    cum_weight_dict = dict()
+    parent_name_queue = collections.deque([ROOT_NODE_DEFAULT_NAME])
+    while parent_name_queue:
+        parent_name = parent_name_queue.popleft()
+        for child_name in family_tree.get(parent_name, []):
+            child_weight = node_weights[child_name]
+            if parent_name != ROOT_NODE_DEFAULT_NAME:
+                child_weight = cum_weight_dict[parent_name] * child_weight
+
+            cum_weight_dict[child_name] = child_weight
+            parent_name_queue.append(child_name)
+
+    model_weight_tensor = tf.stack(
+        [cum_weight_dict[model_name] for model_name in model_names_list],
+        axis=-1, name=name)
 
     return model_weight_tensor, model_names_list
 
@@ -241,9 +300,7 @@ def check_leaf_models(family_tree, base_pred):
     # TODO(jereliu): check if there's missing link between nodes
 
     # check root name
-    try:
-        family_tree[ROOT_NODE_DEFAULT_NAME]
-    except KeyError:
+    if ROOT_NODE_DEFAULT_NAME not in family_tree:
         raise ValueError(
             "Root node name must be '{}'. "
             "However it is not found in family_tree".format(ROOT_NODE_DEFAULT_NAME))
@@ -259,14 +316,12 @@ def check_leaf_models(family_tree, base_pred):
 
     # check all leaf nodes in family_tree exists in base_pred
     leaf_ancestry_dict = get_leaf_ancestry(family_tree)
-    for leaf_node_name in list(leaf_ancestry_dict.keys()):
-        try:
-            base_pred[leaf_node_name]
-        except KeyError:
-            raise ValueError(
-                "model name '{}' in family_tree not found in base_pred.\n"
-                "Models available in base_pred are: \n {}".format(
-                    leaf_node_name, list(base_pred.keys())))
+    missing_leaf_names = set(leaf_ancestry_dict) - set(base_pred)
+    if missing_leaf_names:
+        raise ValueError(
+            "model name {} in family_tree not found in base_pred.\n"
+            "Models available in base_pred are: \n {}".format(
+                sorted(missing_leaf_names), list(base_pred.keys())))
 
     return leaf_ancestry_dict
 
@@ -295,7 +350,8 @@ def prior(X, base_pred, family_tree=None,
             with args (X, **kwargs). Default to rbf.
         link_func: (function) a link function that transforms the unnormalized
             base ensemble weights to a K-dimension simplex. Default to sparse_softmax.
-            This function has args (logits, temp)
+            This function has args (logits, temp), and temp is passed in
+            already broadcastable to logits, see sparse_conditional_weight.
         ridge_factor: (float32) ridge factor to stabilize Cholesky decomposition.
         name: (str) name of the ensemble weight node on the computation graph.
         **kwargs: Additional parameters to pass to sparse_conditional_weight.
@@ -352,9 +408,10 @@ def sparse_conditional_weight(X, parent_name, child_names,
             with args (X, **kwargs).
         link_func: (function) a link function that transforms the unnormalized
             base ensemble weights to a K-dimension simplex.
-            This function has args (logits, temp)
+            This function has args (logits, temp), and temp is passed in
+            already broadcastable to logits.
         ridge_factor: (float32) ridge factor to stabilize Cholesky decomposition.
-        **kernel_kwargs: Additional parameters to pass to kernel_func through gp.prior.
+        **kernel_kwargs: Additional parameters to pass to kernel_func through gp.prior_batched.
 
     Returns:
         (list of tf.Tensor) List normalized ensemble weights, dimension (N, M) with
@@ -369,16 +426,35 @@ def sparse_conditional_weight(X, parent_name, child_names,
                          name='{}_{}'.format(TEMP_NAME_PREFIX, parent_name))
 
     if not isinstance(base_weights, tf.Tensor):
-        base_weights = tf.stack([
-            gp.prior(X, kernel_func=kernel_func,
-                     ridge_factor=ridge_factor,
-                     name='{}_{}'.format(BASE_WEIGHT_NAME_PREFIX, model_name),
-                     **kernel_kwargs)
-            for model_name in child_names], axis=-1)
+        base_weights = tf.stack(
+            gp.prior_batched(X, kernel_func=kernel_func,
+                             ridge_factor=ridge_factor,
+                             names=['{}_{}'.format(BASE_WEIGHT_NAME_PREFIX, model_name)
+                                    for model_name in child_names],
+                             **kernel_kwargs), axis=-1)
+
+    # reshape temperature for broadcasting, once at graph construction
+    temp = tf.exp(temp)
+    if base_weights.shape.ndims >= 2:
+        dim_diff = base_weights.shape.ndims - temp.shape.ndims
+        temp = tf.reshape(temp, shape=temp.shape.as_list() + [1] * dim_diff)
 
     # define transformed random variables
-    weight_transformed = link_func(base_weights, tf.exp(temp),
-                                   name='{}_{}'.format(COND_WEIGHT_NAME_PREFIX, parent_name))
+    if num_model == 2 and link_func is sparse_softmax:
+        # for binary split, sparse_softmax reduces to sigmoid of logit difference,
+        # compute both weights with sigmoid to avoid underflow of 1 - sigmoid.
+        weight_diff = (base_weights[..., :1] - base_weights[..., 1:]) / temp
+        weight_transformed = tf.sigmoid(tf.concat([-weight_diff, weight_diff], axis=-1),
+                                        name='{}_{}'.format(COND_WEIGHT_NAME_PREFIX,
+                                                            parent_name))
+    elif link_func is sparse_softmax:
+        weight_transformed = sparse_softmax(base_weights, temp, pre_broadcast=True,
+                                            name='{}_{}'.format(COND_WEIGHT_NAME_PREFIX,
+                                                                parent_name))
+    else:
+        weight_transformed = link_func(base_weights, temp,
+                                       name='{}_{}'.format(COND_WEIGHT_NAME_PREFIX,
+                                                           parent_name))
 
     # split into list then return
     # TODO(jereliu): Ugly code.
@@ -392,6 +468,14 @@ def sparse_conditional_weight(X, parent_name, child_names,
 """"""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
 
 
+# batched counterparts of gp variational families, which share kernel
+# matrices and variational parameter variables across all nodes.
+_GP_VI_FAMILY_BATCHED = {
+    gp.variational_mfvi: gp.variational_mfvi_batched,
+    gp.variational_sgpr: gp.variational_sgpr_batched,
+}
+
+
 def variational_family(X, base_pred, family_tree=None,
                        gp_vi_family=gp.variational_mfvi,
                        **kwargs):
@@ -405,17 +489,20 @@ def variational_family(X, base_pred, family_tree=None,
             specify the family tree between models, if None then assume there's
             no structure (i.e. flat structure).
         gp_vi_family: (function) A variational family for node weight
-            GPs in the family tree.
-        kwargs: Additional arguments to pass to gp_vi_family.
+            GPs in the family tree. For gp.variational_mfvi and
+            gp.variational_sgpr, all node weight GPs are built in one
+            batched call.
+        kwargs: Additional arguments to pass to gp_vi_family
+            (e.g. compute_dtype for gp.variational_sgpr).
 
     Returns:
         weight_gp_dict: (dict of ed.RandomVariable) Dictionary of GP random variables
             for each non-root model/model family.
         temp_dict: (dict of ed.RandomVariable) Dictionary of temperature random variables
             for each parent model.
-        weight_gp_mean_dict: (dict of tf.Variable) Dictionary of variational parameters for
+        weight_gp_mean_dict: (dict of tf.Tensor) Dictionary of variational parameters for
             the mean of GP.
-        weight_gp_vcov_dict: (dict of tf.Variable) Dictionary of variational parameters for
+        weight_gp_vcov_dict: (dict of tf.Tensor) Dictionary of variational parameters for
             the stddev or covariance matrix of GP.
         temp_mean_dict: (dict of tf.Variable) Dictionary of variational parameters for
             the mean of temperatures.
@@ -431,28 +518,33 @@ def variational_family(X, base_pred, family_tree=None,
     # TODO(jereliu): Ugly code.
     temp_names = ['temp_{}'.format(name) for name in get_parent_node_names(family_tree)]
     temp_list = [
-        list(inference_util.scalar_gaussian_variational(name='vi_{}'.format(temp_name)))
+        inference_util.scalar_gaussian_variational(name='vi_{}'.format(temp_name))
         for temp_name in temp_names]
-    temp_arr = np.asarray(temp_list).T
+    temp_rv_list, temp_mean_list, temp_sdev_list = zip(*temp_list)
 
-    temp_dict = dict(zip(temp_names, temp_arr[0]))
-    temp_mean_dict = dict(zip(temp_names, temp_arr[1]))
-    temp_sdev_dict = dict(zip(temp_names, temp_arr[2]))
+    temp_dict = dict(zip(temp_names, temp_rv_list))
+    temp_mean_dict = dict(zip(temp_names, temp_mean_list))
+    temp_sdev_dict = dict(zip(temp_names, temp_sdev_list))
 
     # define variational family for GP.
     # TODO(jereliu): Ugly code.
     base_weight_names = ['base_weight_{}'.format(name)
                          for name in get_nonroot_node_names(family_tree)]
-    base_weight_list = [list(gp_vi_family(X, name='vi_{}'.format(weight_name), **kwargs))
-                        for weight_name in base_weight_names]
-    base_weight_arr = np.asarray([weight_par[:-1] for weight_par in base_weight_list]).T
-    mixture_par_arr = [weight_par[-1] for weight_par in base_weight_list]
+    gp_vi_family_batched = _GP_VI_FAMILY_BATCHED.get(gp_vi_family, None)
+    if gp_vi_family_batched:
+        base_weight_list = gp_vi_family_batched(
+            X, names=['vi_{}'.format(weight_name) for weight_name in base_weight_names],
+            name='vi_{}'.format(BASE_WEIGHT_NAME_PREFIX), **kwargs)
+    else:
+        base_weight_list = [gp_vi_family(X, name='vi_{}'.format(weight_name), **kwargs)
+                            for weight_name in base_weight_names]
+    rv_list, mean_list, vcov_list, mixture_par_list = zip(*base_weight_list)
 
     # prepare outcome containers
-    weight_gp_dict = dict(zip(base_weight_names, base_weight_arr[0]))
-    weight_gp_mean_dict = dict(zip(base_weight_names, base_weight_arr[1]))
-    weight_gp_vcov_dict = dict(zip(base_weight_names, base_weight_arr[2]))
-    mixture_par_dict = dict(zip(base_weight_names, mixture_par_arr))
+    weight_gp_dict = dict(zip(base_weight_names, rv_list))
+    weight_gp_mean_dict = dict(zip(base_weight_names, mean_list))
+    weight_gp_vcov_dict = dict(zip(base_weight_names, vcov_list))
+    mixture_par_dict = dict(zip(base_weight_names, mixture_par_list))
 
     return (weight_gp_dict, temp_dict,
             weight_gp_mean_dict, weight_gp_vcov_dict,
@@ -469,9 +561,9 @@ def variational_family_sample(n_sample, mfvi_mixture,
     Args:
         n_sample: (int) Number of samples to draw from variational family.
         mfvi_mixture: (bool) Whether the family is a GP-MF mixture.
-        weight_gp_mean_dict: (dict of tf.Variable) Dictionary of variational parameters
+        weight_gp_mean_dict: (dict of tf.Tensor) Dictionary of variational parameters
             for the mean of GP.
-        weight_gp_vcov_dict: (dict of tf.Variable) Dictionary of variational parameters
+        weight_gp_vcov_dict: (dict of tf.Tensor) Dictionary of variational parameters
             for the stddev or covariance matrix of GP.
         temp_mean_dict: (dict of tf.Variable) Dictionary of variational parameters for
             the mean of temperatures.
@@ -1,5 +1,4 @@
 """Utility functions for posterior inference"""
-import numpy as np
 
 import tensorflow as tf
 import tensorflow_probability as tfp
@@ -7,6 +6,9 @@ from tensorflow_probability import edward2 as ed
 
 tfd = tfp.distributions
 
+# jitter for Cholesky decomposition in make_cond_gp_parameters (float64).
+_COND_GP_JITTER = 1e-10
+
 
 def make_value_setter(**model_kwargs):
     """Creates a value-setting interceptor for VI under Edward2."""
@@ -24,7 +26,8 @@ def make_value_setter(**model_kwargs):
 def make_sparse_gp_parameters(m, S,
                               X, Z, ls, kern_func,
                               ridge_factor=1e-3,
-                              mean_name='qf_mean', compute_mean=True):
+                              mean_name='qf_mean', compute_mean=True,
+                              compute_dtype=tf.float32):
     """Produces variational parameters for sparse GP approximation.
 
     Args:
@@ -39,35 +42,109 @@ def make_sparse_gp_parameters(m, S,
         mean_name: (str) name for the mean parameter
         compute_mean: (bool) If False, mean variational parameter is not computed.
             In this case, its ok to have m=None
+        compute_dtype: (tf.DType) dtype for projecting m and S to X, i.e. the
+            matrix products with Kxz Kzz^{-1} (e.g. tf.bfloat16 or tf.float16
+            on accelerators). Kxx - Kxz Kzz^{-1} Kzx and the Cholesky
+            decomposition are always done in float32, since their rounding
+            error at reduced precision can exceed ridge_factor and make the
+            covariance non positive-definite. Outputs are float32.
 
     Returns:
         Mu (tf.Tensor or none) Mean parameters for sparse Gaussian Process, shape (Nx, ).
             if compute_mean=False, then Mu is None.
         Sigma (tf.Tensor) Covariance parameters for sparse Gaussian Process, shape (Nx, Nx).
     """
-    Nx, Nz = X.shape[0], Z.shape[0]
+    Kxz_Kzz_inv, Sigma_pre = make_sparse_gp_projection(
+        X, Z, ls, kern_func, ridge_factor=ridge_factor)
+
+    return project_sparse_gp_parameters(m, S, Kxz_Kzz_inv, Sigma_pre,
+                                        ridge_factor=ridge_factor,
+                                        mean_name=mean_name,
+                                        compute_mean=compute_mean,
+                                        compute_dtype=compute_dtype)
+
+
+def make_sparse_gp_projection(X, Z, ls, kern_func, ridge_factor=1e-3):
+    """Computes the variational-parameter-free components of sparse GP approximation.
+
+    These only depend on the data and the kernel, therefore can be shared
+    by all sparse GPs with the same X, Z and kernel.
 
+    Args:
+        X: (np.ndarray of float32) input training features, with dimension (Nx, D).
+        Z: (np.ndarray of float32) inducing points, with dimension (Nz, D).
+        ls: (float32) length scale parameter.
+        kern_func: (function) kernel function.
+        ridge_factor: (float32) small ridge factor to stabilize Cholesky decomposition
+
+    Returns:
+        Kxz_Kzz_inv (tf.Tensor) Projection from inducing points to X, Kxz Kzz^{-1},
+            shape (Nx, Nz).
+        Sigma_pre (tf.Tensor) Conditional covariance of f given latent GP,
+            Kxx - Kxz Kzz^{-1} Kxz^T, shape (Nx, Nx).
+    """
     # compute matrix constants
     Kxx = kern_func(X, ls=ls)
     Kxz = kern_func(X, Z, ls=ls)
     Kzz = kern_func(Z, ls=ls, ridge_factor=ridge_factor)
 
-    # compute null covariance matrix using Cholesky decomposition
-    Kzz_chol_inv = tf.matrix_inverse(tf.cholesky(Kzz))
-    Kzz_inv = tf.matmul(Kzz_chol_inv, Kzz_chol_inv, transpose_a=True)
+    # compute null covariance matrix using Cholesky decomposition Kzz = LL^T
+    Kzz_chol = tf.cholesky(Kzz)
+
+    # use triangular solves instead of explicit inverse, i.e.
+    # Kzz_chol_inv_Kzx = L^{-1} Kxz^T, Kzz_inv_Kzx = L^{-T} L^{-1} Kxz^T
+    Kzz_chol_inv_Kzx = tf.matrix_triangular_solve(Kzz_chol, tf.transpose(Kxz),
+                                                  lower=True)
+    Kzz_inv_Kzx = tf.matrix_triangular_solve(Kzz_chol, Kzz_chol_inv_Kzx,
+                                             lower=True, adjoint=True)
+
+    Kxz_Kzz_inv = tf.transpose(Kzz_inv_Kzx)
+    Sigma_pre = Kxx - tf.matmul(Kzz_chol_inv_Kzx, Kzz_chol_inv_Kzx, transpose_a=True)
+
+    return Kxz_Kzz_inv, Sigma_pre
+
+
+def project_sparse_gp_parameters(m, S, Kxz_Kzz_inv, Sigma_pre,
+                                 ridge_factor=1e-3,
+                                 mean_name='qf_mean', compute_mean=True,
+                                 compute_dtype=tf.float32):
+    """Projects variational parameters of latent GP to that of the sparse GP.
 
-    Kxz_Kzz_chol_inv = tf.matmul(Kxz, Kzz_chol_inv, transpose_b=True)
-    Kxz_Kzz_inv = tf.matmul(Kxz, Kzz_inv)
-    Sigma_pre = Kxx - tf.matmul(Kxz_Kzz_chol_inv, Kxz_Kzz_chol_inv, transpose_b=True)
+    Args:
+        m: (tf.Tensor or None) Variational parameter for mean of latent GP, shape (Nz, )
+            Can be None if compute_mean=False
+        S: (tf.Tensor) Variational parameter for covariance of latent GP, shape (Nz, Nz)
+        Kxz_Kzz_inv: (tf.Tensor) Projection matrix, shape (Nx, Nz).
+            See make_sparse_gp_projection.
+        Sigma_pre: (tf.Tensor) Conditional covariance matrix, shape (Nx, Nx).
+            See make_sparse_gp_projection.
+        ridge_factor: (float32) small ridge factor to stabilize Cholesky decomposition
+        mean_name: (str) name for the mean parameter
+        compute_mean: (bool) If False, mean variational parameter is not computed.
+            In this case, its ok to have m=None
+        compute_dtype: (tf.DType) dtype for the projection matrix products,
+            see make_sparse_gp_parameters.
+
+    Returns:
+        Mu (tf.Tensor or none) Mean parameters for sparse Gaussian Process, shape (Nx, ).
+            if compute_mean=False, then Mu is None.
+        Sigma (tf.Tensor) Covariance parameters for sparse Gaussian Process, shape (Nx, Nx).
+    """
+    Nx = Sigma_pre.shape.as_list()[0]
+
+    Kxz_Kzz_inv = tf.cast(Kxz_Kzz_inv, compute_dtype)
+    S = tf.cast(S, compute_dtype)
 
     # compute sparse gp variational parameter (i.e. mean and covariance of P(f_obs | f_latent))
     Sigma = (Sigma_pre +
-             tf.matmul(Kxz_Kzz_inv,
-                       tf.matmul(S, Kxz_Kzz_inv, transpose_b=True)) +
+             tf.cast(tf.matmul(Kxz_Kzz_inv,
+                               tf.matmul(S, Kxz_Kzz_inv, transpose_b=True)),
+                     tf.float32) +
              ridge_factor * tf.eye(Nx))
 
     if compute_mean:
-        Mu = tf.tensordot(Kxz_Kzz_inv, m, [[1], [0]], name=mean_name)
+        Mu = tf.tensordot(Kxz_Kzz_inv, tf.cast(m, compute_dtype), [[1], [0]])
+        Mu = tf.identity(tf.cast(Mu, tf.float32), name=mean_name)
     else:
         Mu = None
 
@@ -80,45 +157,75 @@ def make_cond_gp_parameters(K_00, K_11, K_22,
                             ridge_factor_Sigma=1e-3):
     """Computes the conditional posterior for f_new|f_obs, f_deriv.
 
-    For stability, numpy is used instead of tensorflow.
+    For stability, computation is done in float64, and linear systems are
+    solved by Cholesky decomposition, with a small jitter (_COND_GP_JITTER)
+    added to the diagonal of each matrix that is decomposed.
 
+    Args:
+        K_00: (tf.Tensor) Kernel matrix for f_new, dimension (N_new, N_new).
+        K_11: (tf.Tensor) Kernel matrix for f_obs, dimension (N_obs, N_obs).
+        K_22: (tf.Tensor) Kernel matrix for f_deriv, dimension (N_deriv, N_deriv).
+        K_01: (tf.Tensor) Cross kernel between f_new and f_obs, dimension (N_new, N_obs).
+        K_20: (tf.Tensor) Cross kernel between f_deriv and f_new, dimension (N_deriv, N_new).
+        K_21: (tf.Tensor) Cross kernel between f_deriv and f_obs, dimension (N_deriv, N_obs).
+        ridge_factor_K: (float32) ridge factor added to the diagonal of
+            K_22_1, the covariance of f_deriv given f_obs.
+        ridge_factor_Sigma: (float32) unused.
+
+    Returns:
+        P_01 (tf.Tensor of float32) Projection from f_obs to f_new.
+        P_02 (tf.Tensor of float32) Projection from f_deriv to f_new.
+        Sigma (tf.Tensor of float32) Covariance matrix for f_new.
     """
-    # convert to np array
-    with tf.Session() as sess:
-        K_00, K_11, K_22, K_01, K_20, K_21 = sess.run([
-            K_00, K_11, K_22, K_01, K_20, K_21
-        ])
-        K_00 = K_00.astype(np.float64)
-        K_11 = K_11.astype(np.float64)
-        K_22 = K_22.astype(np.float64)
-        K_01 = K_01.astype(np.float64)
-        K_20 = K_20.astype(np.float64)
-        K_21 = K_21.astype(np.float64)
-
-    # compute matrix components
-    K_11_inv_12 = np.matmul(np.linalg.pinv(K_11), K_21.T)
-    K_22_inv_21 = np.matmul(np.linalg.pinv(K_22), K_21)
+    K_00 = tf.cast(K_00, tf.float64)
+    K_11 = tf.cast(K_11, tf.float64)
+    K_22 = tf.cast(K_22, tf.float64)
+    K_01 = tf.cast(K_01, tf.float64)
+    K_20 = tf.cast(K_20, tf.float64)
+    K_21 = tf.cast(K_21, tf.float64)
+
+    N_obs = K_11.shape.as_list()[0]
+    N_deriv = K_22.shape.as_list()[0]
+
+    jitter_obs = _COND_GP_JITTER * tf.eye(N_obs, dtype=tf.float64)
+    jitter_deriv = _COND_GP_JITTER * tf.eye(N_deriv, dtype=tf.float64)
+
+    # compute matrix components,
+    # solve K_11 once for both K_21^T and K_01^T.
+    K_11_chol = tf.cholesky(K_11 + jitter_obs)
+    K_22_chol = tf.cholesky(K_22 + jitter_deriv)
+
+    K_11_inv_12_10 = tf.cholesky_solve(K_11_chol,
+                                       tf.concat([tf.transpose(K_21),
+                                                  tf.transpose(K_01)], axis=1))
+    K_11_inv_12 = K_11_inv_12_10[:, :N_deriv]
+    K_11_inv_10 = K_11_inv_12_10[:, N_deriv:]
+    K_22_inv_21 = tf.cholesky_solve(K_22_chol, K_21)
 
     # assemble projection matrix
-    K_02_1 = K_20.T - np.matmul(K_01, K_11_inv_12)
-    K_22_1 = (K_22 - np.matmul(K_21, K_11_inv_12) +
-              ridge_factor_K * np.eye(K_22.shape[0]))
-    K_01_2 = K_01 - np.matmul(K_20.T, K_22_inv_21)
-    K_11_2 = K_11 - np.matmul(K_21.T, K_22_inv_21)
-
-    # compute mean projection matrix
-    P_01 = np.matmul(K_01_2, np.linalg.pinv(K_11_2))
-    P_02 = np.matmul(K_02_1, np.linalg.pinv(K_22_1))
-
-    # compute Cholesky decomposition for covariance matrix.
-    Sigma = K_00 - K_01.dot(np.linalg.pinv(K_11).dot(K_01.T))
+    K_02_1 = tf.transpose(K_20) - tf.matmul(K_01, K_11_inv_12)
+    K_22_1 = (K_22 - tf.matmul(K_21, K_11_inv_12) +
+              ridge_factor_K * tf.eye(N_deriv, dtype=tf.float64))
+    K_01_2 = K_01 - tf.matmul(K_20, K_22_inv_21, transpose_a=True)
+    K_11_2 = K_11 - tf.matmul(K_21, K_22_inv_21, transpose_a=True)
+
+    # compute mean projection matrix, i.e.
+    # P_01 = K_01_2 * inv(K_11_2), P_02 = K_02_1 * inv(K_22_1),
+    # where K_11_2 and K_22_1 are symmetric.
+    P_01 = tf.transpose(tf.cholesky_solve(tf.cholesky(K_11_2 + jitter_obs),
+                                          tf.transpose(K_01_2)))
+    P_02 = tf.transpose(tf.cholesky_solve(tf.cholesky(K_22_1 + jitter_deriv),
+                                          tf.transpose(K_02_1)))
+
+    # compute covariance matrix.
+    Sigma = K_00 - tf.matmul(K_01, K_11_inv_10)
     # np.matmul(P_01, K_01.T)
     # - np.matmul(P_02, K_20) +
     # ridge_factor_Sigma * np.eye(K_00.shape[0]))
 
-    # Sigma_chol = np.linalg.cholesky(Sigma).astype(np.float32)
-
-    return P_01.astype(np.float32), P_02.astype(np.float32), Sigma
+    return (tf.cast(P_01, tf.float32),
+            tf.cast(P_02, tf.float32),
+            tf.cast(Sigma, tf.float32))
 
 
 def make_mfvi_mixture_family(n_mixture, N, name):
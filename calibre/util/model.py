@@ -3,10 +3,16 @@
 import tensorflow as tf
 import numpy as np
 
+# XLA compilation scope for graph-mode ops.
+try:
+    _jit_scope = tf.xla.experimental.jit_scope
+except AttributeError:
+    _jit_scope = tf.contrib.compiler.jit.experimental_jit_scope
+
 """ Link functions. """
 
 
-def sparse_softmax(logits, temp, name='weight'):
+def sparse_softmax(logits, temp, name='weight', pre_broadcast=False):
     """Defines the sparse softmax function (i.e. normalized exp with temperature).
 
     That is,
@@ -19,6 +25,8 @@ def sparse_softmax(logits, temp, name='weight'):
         temp: (tf.Tensor of float32) temperature parameter, it has size
             (batch_size, ).
         name: (str) Name of the output weights.
+        pre_broadcast: (bool) Whether temp is already reshaped by the caller
+            to be broadcastable to logits, in which case it is used as is.
     Returns:
         A `Tensor`. Has the same type as `logits`. It has shape
             (batch_size, num_obs, num_model).
@@ -37,16 +45,32 @@ def sparse_softmax(logits, temp, name='weight'):
     if logits.get_shape().ndims < 1:
         raise ValueError("Dimension of logits must be more than 1.")
 
-    if logits.get_shape().ndims >= 2:
+    if logits.get_shape().ndims >= 2 and not pre_broadcast:
         # if dimension is 2 or more, adjust dimension for broadcasting
         dim_diff = logits.get_shape().ndims - temp.get_shape().ndims
         temp = tf.reshape(temp, shape=temp.get_shape().as_list() + [1] * dim_diff)
 
-    # compute denominator
-    log_exp_list = -logits / temp
-    log_expits = log_exp_list - tf.reduce_logsumexp(log_exp_list, -1, keepdims=True)
+    return _sparse_softmax_impl(logits, temp, name=name)
+
+
+def _sparse_softmax_impl(logits, temp, name='weight'):
+    """Computes softmax(-logits / temp) over the last axis.
+
+    Ops are placed in an XLA jit scope, so the scaling, max-subtraction,
+    exp and normalization are fused into a single kernel.
+
+    Args:
+        logits: (tf.Tensor of float32) base logits, dimension
+            (batch_size, num_obs, num_model).
+        temp: (tf.Tensor of float32) temperature parameter already
+            broadcastable to logits.
+        name: (str) Name of the output weights.
 
-    return tf.exp(log_expits, name=name)
+    Returns:
+        A `Tensor`. Has the same type and shape as `logits`.
+    """
+    with _jit_scope():
+        return tf.exp(tf.nn.log_softmax(-logits / temp, axis=-1), name=name)
 
 
 def sigmoid(x):
@@ -497,7 +497,10 @@ for family_name in family_names:
         #     ridge_factor_K=1e-1,
         #     ridge_factor_Sigma=0.)
         #
-        # Sigma = pred_cond_pars[2]
+        # with tf.Session() as sess:
+        #     pred_cond_pars = sess.run(pred_cond_pars)
+        #
+        # Sigma = pred_cond_pars[2].astype(np.float64)
         # # Sigma[np.abs(Sigma) < 1e-1] = 0
         # Sigma_chol = np.linalg.cholesky(Sigma + 1e-3 * np.eye(Sigma.shape[0]))
         # pred_cond_pars = list(pred_cond_pars)